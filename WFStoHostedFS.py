@@ -1,10 +1,49 @@
 import requests
+from requests.adapters import HTTPAdapter
+import logging
 import time
-import xml.etree.ElementTree as ET
+import re
+import hmac
 import json
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
 from arcgis.gis import GIS
 from arcgis.features import FeatureLayer
 from pyproj import Transformer
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+logger = logging.getLogger(__name__)
+
+# ijson is optional; it decodes features straight off the socket without buffering the body.
+# Only its C backend is fast enough to be worth it, and orjson is preferred when installed.
+try:
+    import ijson
+    if ijson.backend != "yajl2_c":
+        ijson = None
+except ImportError:
+    ijson = None
+
+# orjson is optional; it parses large GeoJSON bodies faster than the stdlib json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# shapely is optional; without it polygons are uploaded unsimplified
+try:
+    from shapely.geometry import Polygon, shape
+except ImportError:
+    shape = None
+
+# fiona is optional; without it WFS data is always requested as GeoJSON
+try:
+    from fiona.errors import FionaError
+    from fiona.io import MemoryFile
+except ImportError:
+    MemoryFile = None
 
 
 # Load credentials from config.json
@@ -33,175 +72,535 @@ feature_data_params = {
     "outputFormat": "application/json"
 }
 
+# Features per WFS request and number of pages fetched at once; None fetches everything in one request.
+# wfs_page_size must not exceed the server's maxFeatures limit, otherwise the pages come
+# back short and the sync pass fails instead of updating the layer.
+wfs_page_size = None
+wfs_page_workers = 4
+
+# Key field that pages are sorted on, so separate page requests don't overlap or skip features
+wfs_page_sort_field = "identifier"
+
+# Compact binary format to request when fiona is available, None to always use GeoJSON
+binary_output_format = "application/flatgeobuf"
+
+# Shared HTTP session so WFS polls reuse the same keep-alive connection
+session = requests.Session()
+session.headers.update({"Accept-Encoding": "gzip"})
+# Retries are handled by retry_wfs_request, not by the adapter
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
+
 # Initialize previous feature count
 prev_feature_count = None
 
+# Validators from the last hits response, used for conditional requests
+_last_etag = None
+_last_modified = None
+_last_count = None
+
+# True when the last hits request came back 304 Not Modified
+hits_not_modified = False
+
+# Interval (seconds) for a full WFS vs hosted layer comparison even while the WFS reports
+# no change, so edits made directly to the hosted layer are still caught
+full_check_interval = 900
+last_full_check = None
+
+# numberOfFeatures attribute on the hits response root element
+number_of_features_pattern = re.compile(rb'numberOfFeatures=["\'](\d+)["\']')
+
+# Polling interval (seconds) and the cap for backoff while nothing changes
+poll_interval = 60
+max_poll_interval = 900
+
+# (connect, read) timeout in seconds for WFS requests, so a hung socket fails the poll
+wfs_timeout = (10, 60)
+
+# Connection failures, timeouts and server-side (5xx) or rate limit (429) responses are transient
+def is_transient_wfs_error(error):
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and (error.response.status_code >= 500 or error.response.status_code == 429)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+# Retry transient WFS failures with exponential backoff; other errors propagate immediately
+retry_wfs_request = retry(
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception(is_transient_wfs_error),
+    reraise=True
+)
+
 # Fetch WFS feature count
+@retry_wfs_request
 def fetch_feature_count():
-    response = requests.get(wfs_url, params=feature_count_params)
+    global _last_etag, _last_modified, _last_count, hits_not_modified
+    headers = {}
+    if _last_etag:
+        headers["If-None-Match"] = _last_etag
+    if _last_modified:
+        headers["If-Modified-Since"] = _last_modified
+    response = session.get(wfs_url, params=feature_count_params, headers=headers, timeout=wfs_timeout)
+    # Unchanged since the last poll: skip the body and reuse the cached count
+    hits_not_modified = response.status_code == 304 and _last_count is not None
+    if hits_not_modified:
+        return _last_count
     response.raise_for_status()  # Raise an exception for HTTP errors
-    root = ET.fromstring(response.text)
-    return int(root.attrib.get("numberOfFeatures", 0))
+    # Only one attribute is needed, so search for it instead of parsing the XML
+    match = number_of_features_pattern.search(response.content)
+    _last_etag = response.headers.get("ETag")
+    _last_modified = response.headers.get("Last-Modified")
+    _last_count = int(match.group(1)) if match else 0
+    return _last_count
 
-# Fetch WFS data
-def fetch_wfs_data(wfs_url, feature_data_params):
-    response = requests.get(wfs_url, params=feature_data_params)
+# Fetch WFS data as FlatGeobuf and decode it into GeoJSON-like features.
+# Returns None if the server does not support the format or the body can't be decoded.
+def fetch_wfs_binary(wfs_url, feature_data_params):
+    params = {**feature_data_params, "outputFormat": binary_output_format}
+    response = session.get(wfs_url, params=params, timeout=wfs_timeout)
+    # GeoServer reports unsupported formats either as an HTTP error or as an XML exception report
+    if response.status_code in (400, 406) or "xml" in response.headers.get("Content-Type", ""):
+        logger.info("WFS rejected %s (HTTP %s).", binary_output_format, response.status_code)
+        return None
     response.raise_for_status()  # Raise an exception for HTTP errors
-    return response.json()
+    # GDAL builds without the FlatGeobuf driver, or an unreadable body, fail here
+    try:
+        with MemoryFile(response.content) as memfile, memfile.open() as src:
+            features = [
+                feature.__geo_interface__ if hasattr(feature, "__geo_interface__") else feature
+                for feature in src
+            ]
+    except (FionaError, ValueError, RuntimeError) as e:
+        logger.warning("Could not decode %s response: %s", binary_output_format, e)
+        return None
+    return {"features": features}
 
+# File-like wrapper over response.iter_content, so ijson reads through requests and
+# connection failures mid-stream surface as requests exceptions
+class ResponseStream:
+    def __init__(self, response, chunk_size=65536):
+        self.chunks = response.iter_content(chunk_size)
 
-# Construct the GeoJSON object for the new feature
-def construct_geojson(feature):
-    coordinates = feature['geometry']['coordinates']
-    properties = feature['properties']
+    def read(self, size=-1):
+        return next(self.chunks, b"")
 
+# Stream WFS GeoJSON features one at a time as they are parsed
+def stream_wfs_features(wfs_url, feature_data_params):
+    with session.get(wfs_url, params=feature_data_params, stream=True, timeout=wfs_timeout) as response:
+        response.raise_for_status()  # Raise an exception for HTTP errors
+        yield from ijson.items(ResponseStream(response), "features.item", use_float=True)
 
-    geojson_feature = {
-        "type": "Feature",
-        "geometry": {
-            "type": "Polygon",
-            "coordinates": coordinates
-        },
-        "properties": {
-            "alertId": properties.get("alertId"),
-            "category": properties.get("category"),
-            "certainty": properties.get("certainty"),
-            "description": properties.get("description"),
-            "event": properties.get("event"),
-            "headline": properties.get("headline"),
-            "id": properties.get("id"),
-            "identifier": properties.get("identifier"),
-            "instruction": properties.get("instruction"),
-            "scope": properties.get("scope"),
-            "severity": properties.get("severity"),
-            "status": properties.get("status"),
-            "urgency": properties.get("urgency"),
-            "uuid": properties.get("uuid")
+# Fetch one request's worth of WFS data
+def fetch_wfs_page(wfs_url, feature_data_params):
+    global binary_output_format
+    if MemoryFile is not None and binary_output_format:
+        wfs_data = fetch_wfs_binary(wfs_url, feature_data_params)
+        if wfs_data is not None:
+            return wfs_data
+        # Don't ask again on every poll once the format has been refused or failed to decode
+        logger.info("Falling back to GeoJSON instead of %s.", binary_output_format)
+        binary_output_format = None
+    if orjson is None and ijson is not None:
+        return {"features": list(stream_wfs_features(wfs_url, feature_data_params))}
+    response = session.get(wfs_url, params=feature_data_params, timeout=wfs_timeout)
+    response.raise_for_status()  # Raise an exception for HTTP errors
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+# Fetch WFS data, in concurrent pages of wfs_page_size features when paging is enabled.
+# Pages are bounded by the total from the hits request; a page larger than wfs_page_size
+# or a collected count that doesn't match the total raises instead of returning a partial
+# collection, which the diff would otherwise turn into deletes.
+@retry_wfs_request
+def fetch_wfs_data(wfs_url, feature_data_params, total=None):
+    if not wfs_page_size:
+        return fetch_wfs_page(wfs_url, feature_data_params)
+    if total is None:
+        total = fetch_feature_count()
+
+    def fetch_page(start_index):
+        params = {
+            **feature_data_params,
+            "startIndex": start_index,
+            "maxFeatures": wfs_page_size,
+            "sortBy": wfs_page_sort_field
         }
-    }
-    return geojson_feature
-
-# Push data to ArcGIS
-def push_to_arcgis(geojson_feature, feature_layer):
-    # Mapping dictionary for attribute names to column names
-    attribute_mapping = {
-        "alertId": "alertid",
-        "category": "category",
-        "certainty": "certainty",
-        "description": "description",
-        "event": "event",
-        "headline": "headline",
-        "id": "id",
-        "identifier": "identifier",
-        "instruction": "instruction",
-        "scope": "scope",
-        "severity": "severity",
-        "status": "status",
-        "urgency": "urgency",
-        "uuid": "uuid"        
-    }
-    
-    # Convert GeoJSON to the format expected by ArcGIS
-    arcgis_feature = {
-        "attributes": {},
+        page = fetch_wfs_page(wfs_url, params).get('features', [])
+        if len(page) > wfs_page_size:
+            raise ValueError(
+                f"WFS returned {len(page)} features for a page of {wfs_page_size}; "
+                "the server appears to ignore startIndex/maxFeatures"
+            )
+        return page
+
+    features = []
+    with ThreadPoolExecutor(max_workers=wfs_page_workers) as executor:
+        for page in executor.map(fetch_page, range(0, total, wfs_page_size)):
+            features.extend(page)
+    if len(features) != total:
+        raise ValueError(
+            f"WFS paging collected {len(features)} features but the hits count is {total}; "
+            "check the server's maxFeatures limit against wfs_page_size"
+        )
+    return {"features": features}
+
+
+# WFS attribute names; the hosted layer columns are the same names lowercased
+attribute_fields = (
+    "alertId",
+    "category",
+    "certainty",
+    "description",
+    "event",
+    "headline",
+    "id",
+    "identifier",
+    "instruction",
+    "scope",
+    "severity",
+    "status",
+    "urgency",
+    "uuid"
+)
+
+# (WFS attribute, hosted layer column) pairs, built once
+attribute_columns = tuple((field, field.lower()) for field in attribute_fields)
+
+# CRS of the WFS geometry; anything other than EPSG:4326 is reprojected before upload
+wfs_crs = "EPSG:4326"
+
+# Built once so the PROJ pipeline is not set up again for every feature
+transformer = None if wfs_crs == "EPSG:4326" else Transformer.from_crs(wfs_crs, "EPSG:4326", always_xy=True)
+
+# Reproject polygon rings to EPSG:4326, transforming all vertices in one call
+def reproject_rings(rings):
+    points = transformer.itransform([tuple(point[:2]) for ring in rings for point in ring])
+    reprojected = []
+    for ring in rings:
+        reprojected.append([list(next(points)) for _ in ring])
+    return reprojected
+
+# Douglas-Peucker tolerance in degrees for uploaded polygons, e.g. 0.0005 (about 55 m).
+# Off by default so alert boundaries are uploaded exactly as published; opt in with
+# "simplify_tolerance" in config.json where the map use permits it.
+simplify_tolerance = 0
+
+# Simplify polygon rings, keeping the original rings if the result is not a single polygon
+def simplify_rings(rings, tolerance):
+    geometry = shape({"type": "Polygon", "coordinates": rings}).simplify(tolerance, preserve_topology=True)
+    if not isinstance(geometry, Polygon) or geometry.is_empty:
+        return rings
+    return [list(map(list, geometry.exterior.coords))] + [list(map(list, interior.coords)) for interior in geometry.interiors]
+
+# Convert a WFS GeoJSON feature directly to the format expected by ArcGIS.
+# MultiPolygon parts are flattened into one list of rings, as ArcGIS polygons expect.
+def wfs_to_arcgis(feature):
+    properties = feature["properties"]
+    geometry = feature["geometry"]
+    if geometry.get("type") == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        polygons = [geometry["coordinates"]]
+    rings = []
+    for polygon in polygons:
+        if transformer is not None:
+            polygon = reproject_rings(polygon)
+        if shape is not None and simplify_tolerance:
+            polygon = simplify_rings(polygon, simplify_tolerance)
+        rings.extend(polygon)
+    return {
+        "attributes": {column: properties.get(field) for field, column in attribute_columns},
         "geometry": {
-            "rings": geojson_feature["geometry"]["coordinates"],
-            "spatialReference": {"wkid": 4326}  
+            "rings": rings,
+            "spatialReference": {"wkid": 4326}
         }
     }
 
-    # Map attributes from GeoJSON to ArcGIS feature using attribute_mapping
-    for geojson_attribute, arcgis_column in attribute_mapping.items():
-        arcgis_feature["attributes"][arcgis_column] = geojson_feature["properties"].get(geojson_attribute, None)
-    
-    try:
-        # Add new feature
-        result = feature_layer.edit_features(adds=[arcgis_feature])
-        print("Feature added:", result)
-        if result.get('addResults', []) and not result['addResults'][0]['success']:
-            print("Error adding feature:", result['addResults'][0]['error'])
-    except Exception as e:
-        print(f"Error adding feature to ArcGIS: {e}")
-
-    # Optional: Query features and print information for debugging
-    query_result = feature_layer.query(where="1=1", out_fields="*")
-    for feature in query_result.features:
-        print(f"Feature {feature.attributes['objectid']} - alertId: {feature.attributes['alertid']}")
-
-
-# Delete row from ArcGIS Feature Service
-def delete_row(alertId, feature_layer):
-    where_clause = f"alertid = '{alertId}'"
-    
-    # Query the features to delete using the where clause
-    features_to_delete = feature_layer.query(where=where_clause).features
+# Number of features sent per edit_features request
+edit_chunk_size = 1000
+
+# Number of concurrent edit_features requests; kept low to stay under service rate limits
+edit_workers = 3
+
+# Split a list into edit_features sized chunks
+def chunked(items, chunk_size):
+    return [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
 
-    if not features_to_delete:
-        print(f"No feature found with alertId {alertId} to delete.")
+# Thread pool for concurrent edit_features requests. Workers share the caller's
+# FeatureLayer: edit_features only issues independent REST requests over its GIS
+# connection and keeps no per-request state on the layer.
+def edit_executor():
+    return ThreadPoolExecutor(max_workers=edit_workers)
+
+# Add one chunk of features to ArcGIS
+def add_chunk(chunk, feature_layer):
+    result = feature_layer.edit_features(adds=chunk)
+    logger.info("Features added: %d", len(chunk))
+    for add_result in result.get('addResults', []):
+        if not add_result['success']:
+            logger.error("Error adding feature: %s", add_result['error'])
+
+# Push data to ArcGIS, one edit_features request per chunk, chunks sent concurrently.
+# A failed request is raised to the caller once the pool has finished.
+def bulk_push(arcgis_features, feature_layer, chunk_size=edit_chunk_size):
+    with edit_executor() as executor:
+        list(executor.map(lambda chunk: add_chunk(chunk, feature_layer), chunked(arcgis_features, chunk_size)))
+
+    # Optional: Query features once and log them for debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        query_result = feature_layer.query(where="1=1", out_fields="objectid,alertid", return_geometry=False)
+        for feature in query_result.features:
+            logger.debug("Feature %s - alertId: %s", feature.attributes['objectid'], feature.attributes['alertid'])
+
+# Delete one chunk of rows from ArcGIS by objectid
+def delete_chunk(chunk, feature_layer):
+    result = feature_layer.edit_features(deletes=chunk)
+    logger.info("Rows deleted: %d", len(chunk))
+    for delete_result in result.get('deleteResults', []):
+        if not delete_result['success']:
+            logger.error("Error deleting row: %s", delete_result['error'])
+
+# Delete rows from ArcGIS Feature Service by objectid, chunks sent concurrently
+def bulk_delete(object_ids, feature_layer, chunk_size=edit_chunk_size):
+    with edit_executor() as executor:
+        list(executor.map(lambda chunk: delete_chunk(chunk, feature_layer), chunked(object_ids, chunk_size)))
+
+
+# Share of the layer that may change before an incremental update gives way to a full rebuild
+full_rebuild_ratio = 0.5
+
+# Apply adds and deletes, in a single edit_features request when they fit in one chunk
+def apply_edits(adds, deletes, feature_layer):
+    if len(adds) > edit_chunk_size or len(deletes) > edit_chunk_size:
+        bulk_delete(deletes, feature_layer)
+        bulk_push(adds, feature_layer)
         return
+    result = feature_layer.edit_features(adds=adds or None, deletes=deletes or None)
+    logger.info("Features added: %d, rows deleted: %d", len(adds), len(deletes))
+    for edit_result in result.get('addResults', []) + result.get('deleteResults', []):
+        if not edit_result['success']:
+            logger.error("Error applying edit: %s", edit_result['error'])
 
-    object_ids = [feature.attributes['objectid'] for feature in features_to_delete]
-    
-    result = feature_layer.edit_features(deletes=object_ids)
-    print("Row deleted:", result)
-    if not result['deleteResults'][0]['success']:
-        print("Error deleting row:", result['deleteResults'][0]['error'])
 
-# Load config
-config = load_config(r'C:\\Path\\to\\config.json')
-gis = authenticate_to_gis(config['portal_url'], config['portal_username'], config['portal_password'])
-feature_layer = FeatureLayer('https://url/of/hosted/feature_service', gis)
+# Geometry types wfs_to_arcgis can turn into ArcGIS rings; features without a type are treated as Polygon
+supported_geometry_types = ("Polygon", "MultiPolygon")
 
-prev_feature_count = fetch_feature_count()
+# Check that a WFS feature has the properties and polygon rings the sync relies on
+def is_valid_wfs_feature(feature):
+    if (
+        isinstance(feature, dict)
+        and isinstance(feature.get("properties"), dict)
+        and isinstance(feature.get("geometry"), dict)
+        and feature["geometry"].get("type", "Polygon") in supported_geometry_types
+        and feature["geometry"].get("coordinates")
+    ):
+        return True
+    logger.warning("Skipping malformed WFS feature: %.200r", feature)
+    return False
 
-# Main loop
-while True:
-    try:
-        current_feature_count = fetch_feature_count()
-        
-        # Fetch WFS data and extract GeoJSON features
-        wfs_data = fetch_wfs_data(wfs_url, feature_data_params)
-        geojson_features = wfs_data.get('features', [])
-        
-        # Extract identifiers from GeoJSON features
-        geojson_identifiers = {geojson_feature["properties"].get("identifier", None) for geojson_feature in geojson_features}
-        
-        # Query ArcGIS features
-        arcgis_features = feature_layer.query().features
-        
+# Query ArcGIS features, only the fields needed for comparison and deletes
+def query_arcgis_features(feature_layer):
+    return feature_layer.query(where="1=1", out_fields="identifier,objectid,alertid", return_geometry=False).features
+
+# Run one sync pass: compare WFS against the hosted layer and update it on change.
+# The full comparison is skipped while the WFS reports 304 Not Modified and the count matches
+# the last synced one, unless forced or full_check_interval has elapsed since the last
+# successful pass. Returns True if the layer was updated.
+def sync_once(force=False):
+    global prev_feature_count, last_full_check
+    current_feature_count = fetch_feature_count()
+    if (
+        hits_not_modified
+        and not force
+        and current_feature_count == prev_feature_count
+        and last_full_check is not None
+        and time.monotonic() - last_full_check < full_check_interval
+    ):
+        logger.info("No change (WFS not modified). Current count: %s", current_feature_count)
+        return False
+
+    feature_layer = get_feature_layer()
+    # Fetch WFS data and ArcGIS features concurrently, they are independent requests
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        wfs_future = executor.submit(fetch_wfs_data, wfs_url, feature_data_params, current_feature_count)
+        arcgis_future = executor.submit(query_arcgis_features, feature_layer)
+        wfs_data = wfs_future.result()
+        arcgis_features = arcgis_future.result()
+    # Only recorded once the pass succeeds, so a failed pass is retried in full
+    check_started = time.monotonic()
+    
+    # Extract GeoJSON features and their identifiers, skipping malformed ones
+    geojson_features = [feature for feature in wfs_data.get('features', []) if is_valid_wfs_feature(feature)]
+    geojson_identifiers = {geojson_feature["properties"].get("identifier", None) for geojson_feature in geojson_features}
 
-        # Extract identifiers from ArcGIS features
-        arcgis_identifiers = {feature.attributes.get("identifier") for feature in arcgis_features}
+    # Extract identifiers from ArcGIS features
+    arcgis_identifiers = {feature.attributes.get("identifier") for feature in arcgis_features}
 
-        # Check if there's a change in feature count or identifier
+    # Check if there's a change in feature count or identifier
+    if (
+        prev_feature_count is None 
+        or current_feature_count != prev_feature_count 
+        or arcgis_identifiers != geojson_identifiers
+    ):
+        logger.info(
+            "Previous count: %s, Current count: %s, GEOJSON Identifiers: %s, ESRI Identifiers: %s",
+            prev_feature_count, current_feature_count, geojson_identifiers, arcgis_identifiers
+        )
+        
+        to_add_ids = geojson_identifiers - arcgis_identifiers
+        to_delete_ids = arcgis_identifiers - geojson_identifiers
+        change_count = len(to_add_ids) + len(to_delete_ids)
+        # Duplicate identifiers can't be diffed by set, rebuild instead
+        has_duplicates = (
+            len(geojson_features) != len(geojson_identifiers)
+            or len(arcgis_features) != len(arcgis_identifiers)
+        )
+        if not change_count and not has_duplicates:
+            # Only the hits count moved (it is a separate, possibly cached request); the layer is in sync
+            logger.info("Identifiers already in sync, nothing to update.")
+            prev_feature_count = current_feature_count
+            last_full_check = check_started
+            return False
         if (
-            prev_feature_count is None 
-            or current_feature_count != prev_feature_count 
-            or arcgis_identifiers != geojson_identifiers
+            change_count
+            and change_count <= full_rebuild_ratio * max(len(geojson_identifiers), 1)
+            and not has_duplicates
         ):
-            print(f"Previous count: {prev_feature_count}, Current count: {current_feature_count}, GEOJSON Identifiers: {geojson_identifiers}, ESRI Identifiers: {arcgis_identifiers}")
-            
+            # Only add new alerts and delete expired ones
+            adds = [wfs_to_arcgis(feature) for feature in geojson_features if feature["properties"].get("identifier") in to_add_ids]
+            deletes = [feature.attributes["objectid"] for feature in arcgis_features if feature.attributes.get("identifier") in to_delete_ids]
+            apply_edits(adds, deletes, feature_layer)
+            logger.info("Updated.")
+        else:
             # Delete all existing features from the feature layer
             if arcgis_features:
-                for arcgis_feature in arcgis_features:
-                    delete_row(arcgis_feature.attributes["alertid"], feature_layer)
-                print("Features deleted.")
+                bulk_delete([feature.attributes["objectid"] for feature in arcgis_features], feature_layer)
+                logger.info("Features deleted.")
             
             # Add new features from WFS data
-            for feature in geojson_features:
-                geojson_feature = construct_geojson(feature)
-                push_to_arcgis(geojson_feature, feature_layer)
-            print("Repopulated.")
-            
-            # Update previous feature count
-            prev_feature_count = current_feature_count
-        else:
-            print(f"No change. Current count: {current_feature_count}, GEOJSON Identifiers: {geojson_identifiers}, ESRI Identifiers: {[feature.attributes['identifier'] for feature in arcgis_features]}")
+            bulk_push([wfs_to_arcgis(feature) for feature in geojson_features], feature_layer)
+            logger.info("Repopulated.")
         
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        # Update previous feature count
+        prev_feature_count = current_feature_count
+        last_full_check = check_started
+        return True
+
+    logger.info("No change. Current count: %s", current_feature_count)
+    last_full_check = check_started
+    return False
+
+# Set by the webhook listener when the upstream publisher reports a change
+wfs_changed = threading.Event()
+
+# Webhook endpoint: POST /wfs-changed wakes the main loop for an immediate sync.
+# The shared secret must be sent in the X-Webhook-Token header or the token query parameter.
+class WFSChangedHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/wfs-changed":
+            self.send_response(404)
+            self.end_headers()
+            return
+        token = self.headers.get("X-Webhook-Token") or parse_qs(url.query).get("token", [""])[0]
+        if not hmac.compare_digest(token.encode(), self.server.webhook_secret.encode()):
+            self.send_response(403)
+            self.end_headers()
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            self.send_response(400)
+            self.end_headers()
+            return
+        # Drain the notification body, its content is not needed
+        if length > 0:
+            self.rfile.read(length)
+        wfs_changed.set()
+        self.send_response(202)
+        self.end_headers()
+
+# Start the webhook listener in a background thread
+def start_webhook_listener(host, port, secret):
+    server = ThreadingHTTPServer((host, port), WFSChangedHandler)
+    server.webhook_secret = secret
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info("Listening for WFS change notifications on %s:%d at /wfs-changed", host, port)
+    return server
+
+# Location of config.json and the hosted feature service to sync into
+config_file = r'C:\\Path\\to\\config.json'
+feature_service_url = 'https://url/of/hosted/feature_service'
+
+# Load config once, on first use
+@functools.lru_cache(maxsize=1)
+def get_config():
+    return load_config(config_file)
+
+# Authenticate once; cleared to force a fresh token
+@functools.lru_cache(maxsize=1)
+def get_gis():
+    config = get_config()
+    return authenticate_to_gis(config['portal_url'], config['portal_username'], config['portal_password'])
 
-    # Wait for a specified interval before checking again
-    time.sleep(60)  # Wait for 1 minute
+# Build the hosted feature layer once; cleared along with get_gis
+@functools.lru_cache(maxsize=1)
+def get_feature_layer():
+    return FeatureLayer(feature_service_url, get_gis())
 
+# ArcGIS reports expired or invalid tokens as error codes inside the exception message
+auth_error_markers = ("Invalid token", "Token Required", "Error Code: 498", "Error Code: 499", "Error Code: 401")
+
+# Check whether an exception was caused by an expired or rejected ArcGIS token
+def is_auth_error(error):
+    message = str(error)
+    return any(marker in message for marker in auth_error_markers)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    config = get_config()
+
+    # Optional polygon simplification tolerance, 0 to upload polygons as received
+    simplify_tolerance = config.get('simplify_tolerance', simplify_tolerance)
+
+    # Optional webhook port; when set, polling only serves as a slow fallback.
+    # The listener binds to localhost unless webhook_host says otherwise and
+    # is only started with a webhook_secret to authenticate notifications.
+    webhook_port = config.get('webhook_port')
+    webhook_secret = config.get('webhook_secret')
+    if webhook_port and not webhook_secret:
+        logger.error("webhook_port is set without webhook_secret, not starting the webhook listener.")
+    elif webhook_port:
+        start_webhook_listener(config.get('webhook_host', "127.0.0.1"), int(webhook_port), webhook_secret)
+        poll_interval = max_poll_interval
+
+    prev_feature_count = fetch_feature_count()
+
+    # Number of consecutive polls without a change, drives the backoff
+    unchanged_polls = 0
+
+    # Set when a webhook notification woke the loop, forces a full comparison
+    notified = False
+
+    # Main loop
+    while True:
+        try:
+            if sync_once(force=notified):
+                unchanged_polls = 0
+            else:
+                unchanged_polls += 1
+            
+        except Exception as e:
+            logger.exception("An error occurred during sync")
+            # Re-authenticate on the next pass instead of failing until restart
+            if is_auth_error(e):
+                get_gis.cache_clear()
+                get_feature_layer.cache_clear()
 
+        # Wait before checking again, backing off while nothing changes.
+        # A webhook notification cuts the wait short.
+        notified = wfs_changed.wait(min(poll_interval * 2 ** unchanged_polls, max_poll_interval))
+        wfs_changed.clear()